@@ -1,23 +1,28 @@
-# app.py — Flask backend
-from flask import Flask, request, jsonify
-from llm_wrapper import get_safely_inferred
-import json, os
+# app.py — FastAPI backend
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from llm_wrapper import get_safely_inferred_async
+from pydantic_models import SymptomIn
+import orjson
 
-app = Flask(__name__)
+app = FastAPI()
 
-@app.route("/", methods=["GET"])
-def index():
+@app.get("/", response_class=PlainTextResponse)
+async def index():
     return "Healthcare Symptom Checker — POST /api/symptom-check with {'symptoms':'...'}"
 
-@app.route("/api/symptom-check", methods=["POST"])
-def symptom_check():
-    data = request.get_json(force=True, silent=True)
-    if not data or "symptoms" not in data:
-        return jsonify({"error": "Please POST JSON with 'symptoms' field."}), 400
-
-    symptoms = data["symptoms"]
-    result = get_safely_inferred(symptoms, allow_llm=True)
-    return jsonify(result.dict())
+@app.post("/api/symptom-check")
+async def symptom_check(request: Request):
+    # like Flask's get_json(force=True): parse the body whatever its Content-Type
+    try:
+        body = SymptomIn.model_validate(orjson.loads(await request.body()))
+    except Exception:
+        return JSONResponse({"error": "Please POST JSON with 'symptoms' field."}, status_code=400)
+    # awaits the LLM without holding a worker, so one process serves many checks at once
+    result = await get_safely_inferred_async(body.symptoms, allow_llm=True)
+    # pydantic-core serializes straight to JSON bytes
+    return Response(result.model_dump_json(), media_type="application/json")
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=5000)
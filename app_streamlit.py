@@ -3,6 +3,12 @@ import requests
 import pandas as pd
 import sqlite3, os
 
+# Optional Arrow-backed frames for the history view (pip install polars)
+try:
+    import polars as pl
+except Exception:
+    pl = None
+
 API_LOCAL = "http://127.0.0.1:5000/api/symptom-check"
 DB_PATH = "/content/health-symptom-checker/history.db"
 
@@ -30,11 +36,24 @@ if st.button("Check Symptoms"):
             st.write("•", step)
         st.caption(data["disclaimer"])
 
+@st.cache_resource
+def _conn():
+    # one connection reused across reruns (created only once history.db exists)
+    c = sqlite3.connect(DB_PATH, check_same_thread=False)
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA mmap_size=268435456")  # read pages via mmap instead of read() syscalls
+    c.execute("PRAGMA cache_size=-20000")
+    return c
+
+HISTORY_COLUMNS = ["id", "timestamp_utc", "engine", "top_condition", "top_score"]
+HISTORY_SQL = "SELECT id, timestamp_utc, engine, top_condition, top_score FROM queries ORDER BY id DESC LIMIT 10"
+
 st.sidebar.header("📊 Query History (from DB)")
 if os.path.exists(DB_PATH):
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT * FROM queries ORDER BY id DESC LIMIT 10", conn)
-    conn.close()
+    if pl is not None:
+        df = pl.read_database(HISTORY_SQL, connection=_conn())
+    else:
+        df = pd.DataFrame.from_records(_conn().execute(HISTORY_SQL).fetchall(), columns=HISTORY_COLUMNS)
     st.sidebar.dataframe(df)
 else:
     st.sidebar.info("No history yet.")
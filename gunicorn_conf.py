@@ -0,0 +1,12 @@
+# gunicorn_conf.py — production server: gunicorn -c gunicorn_conf.py app:app
+import multiprocessing
+import os
+
+bind = "0.0.0.0:5000"
+# ASGI workers: each runs one event loop that keeps many LLM calls in flight, and holds
+# its own response cache, embedding model, sqlite writer and HTTP/2 pool, so one per
+# core is enough (override with WEB_CONCURRENCY)
+worker_class = "uvicorn_worker.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+timeout = 30
+keepalive = 5
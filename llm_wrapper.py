@@ -1,33 +1,73 @@
-%%writefile /content/health-symptom-checker/src/llm_wrapper.py
 """
 Clean, self-contained llm_wrapper for the Symptom Checker project.
 
 Provides:
-- call_openai_llm: calls OpenAI (if key present) or mock; logs raw outputs
+- call_openai_llm: async; calls OpenAI (if key present) or mock; logs raw outputs
+- response cache: exact (normalized text) + optional semantic (embedding) tiers for LLM answers
 - parse_and_validate_json: robust JSON extraction + rescue for missing relative_score
-- log_query: writes an anonymized entry to history.db
-- get_safely_inferred: orchestrates rule-based -> emergency -> llm fallback
+- log_query: queues an anonymized entry for the batched history.db writer
+- get_safely_inferred_async: orchestrates rule-based -> emergency -> llm fallback
+- get_safely_inferred: blocking wrapper around get_safely_inferred_async
 """
 
 import os
-import json
+import asyncio
+import atexit
+import orjson
 import re
 import sqlite3
 import hashlib
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
+from functools import lru_cache
 from typing import List, Tuple
 
 # Detect whether to use OpenAI (set OPENAI_API_KEY in env to enable)
 USE_OPENAI = bool(os.environ.get("OPENAI_API_KEY"))
 try:
     import openai
+    import httpx
 except Exception:
     openai = None
     USE_OPENAI = False
 
+# Set DEBUG=1 to also write mock LLM output to RAW_LOG
+DEBUG = bool(os.environ.get("DEBUG"))
+
+# One pooled client per process: keep-alive + HTTP/2 amortize TLS setup across calls
+_OAI = None
+if USE_OPENAI:
+    _OAI = openai.AsyncOpenAI(
+        timeout=15,
+        http_client=httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60),
+        ),
+    )
+
+# Optional semantic cache tier (pip install sentence-transformers to enable)
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except Exception:
+    np = None
+    SentenceTransformer = None
+
+# Optional SIMD hashing (pip install blake3); falls back to stdlib blake2b
+try:
+    from blake3 import blake3 as _blake3
+except Exception:
+    _blake3 = None
+
+logger = logging.getLogger(__name__)
+
 # local imports (project)
 from pydantic_models import SymptomResponse, Condition
-from rule_based_v2 import infer_conditions
+from rule_based_v2 import normalize_text, rule_conditions, scan_keywords
 
 DB_PATH = "/content/health-symptom-checker/history.db"
 RAW_LOG = "/content/health-symptom-checker/llm_raw_logs.txt"
@@ -38,51 +78,161 @@ class _AllowAll:
         return True
 LLM_RATE_LIMITER = _AllowAll()
 
+# Response cache for live LLM answers: exact tier keyed by normalized text,
+# semantic tier matched by cosine similarity of MiniLM embeddings.
+CACHE_MAXSIZE = 1024
+SEMANTIC_THRESHOLD = 0.92
+EMBED_MODEL = "all-MiniLM-L6-v2"
+_EXACT: "OrderedDict[str, SymptomResponse]" = OrderedDict()
+_SEM_VECS = None  # (CACHE_MAXSIZE, dim) float32 ring buffer of L2-normalized embeddings
+_SEM_RESP = []    # responses for the filled rows of _SEM_VECS
+_SEM_NEXT = 0     # next row to (over)write
+_EMBEDDER = None
+_EMBED_LOCK = threading.Lock()
+_EMBED_DISABLED = False
+
+def _symptom_hash(norm_bytes: bytes) -> str:
+    # 128-bit digest of the normalized input: cache key and anonymized history id
+    if _blake3 is not None:
+        return _blake3(norm_bytes).hexdigest(length=16)
+    return hashlib.blake2b(norm_bytes, digest_size=16).hexdigest()
+
+def _embed(symptoms: str):
+    # returns None when the semantic tier is unavailable; a failed model load or
+    # encode switches the tier off for the rest of the process
+    global _EMBEDDER, _EMBED_DISABLED
+    if SentenceTransformer is None or _EMBED_DISABLED:
+        return None
+    try:
+        if _EMBEDDER is None:
+            with _EMBED_LOCK:  # runs in to_thread workers: load the model only once
+                if _EMBEDDER is None and not _EMBED_DISABLED:
+                    _EMBEDDER = SentenceTransformer(EMBED_MODEL)
+        if _EMBEDDER is None:
+            return None
+        vec = _EMBEDDER.encode(symptoms.strip().lower(), normalize_embeddings=True)
+    except Exception:
+        _EMBED_DISABLED = True
+        logger.exception("Semantic cache disabled: embedding model %s failed", EMBED_MODEL)
+        return None
+    return np.asarray(vec, dtype=np.float32)
+
+def _exact_get(key: str):
+    resp = _EXACT.get(key)
+    if resp is not None:
+        _EXACT.move_to_end(key)
+    return resp
+
+def _semantic_get(vec):
+    if vec is None or not _SEM_RESP:
+        return None
+    # cosine against every cached row in one BLAS matrix-vector product
+    scores = _SEM_VECS[:len(_SEM_RESP)] @ vec
+    i = int(scores.argmax())
+    return _SEM_RESP[i] if scores[i] >= SEMANTIC_THRESHOLD else None
+
+def _cache_put(key: str, vec, resp: SymptomResponse):
+    global _SEM_VECS, _SEM_NEXT
+    _EXACT[key] = resp
+    _EXACT.move_to_end(key)
+    if len(_EXACT) > CACHE_MAXSIZE:
+        _EXACT.popitem(last=False)
+    if vec is not None:
+        if _SEM_VECS is None:
+            _SEM_VECS = np.empty((CACHE_MAXSIZE, vec.shape[0]), dtype=np.float32)
+        i = _SEM_NEXT
+        _SEM_VECS[i] = vec
+        if i < len(_SEM_RESP):
+            _SEM_RESP[i] = resp
+        else:
+            _SEM_RESP.append(resp)
+        _SEM_NEXT = (i + 1) % CACHE_MAXSIZE
+
+# Static response pieces, built once at import. Responses share them through
+# SymptomResponse.model_construct, which skips re-validating known-good data.
+_DISCL = "Educational only. Not medical advice."
+_UNCLEAR = "Unclear — further questions required"
+_EMERGENCY_PC = [Condition(condition="Possible emergency — seek immediate care", rationale="Emergency keyword matched.", confidence="high", relative_score=1.0)]
+_EMERGENCY_STEPS = ["Seek emergency care immediately."]
+_CLINICIAN_STEPS = ["Educational only. Consider seeing a clinician for evaluation."]
+_PARSE_ERROR_PC = [Condition(condition=_UNCLEAR, rationale="Fallback due to LLM parse/validation error.", confidence="low", relative_score=0.0)]
+_NO_LLM_PC = [Condition(condition=_UNCLEAR, rationale="LLM disabled or no rules matched.", confidence="low", relative_score=0.0)]
+
+def _static_response(symptoms: str, pcs: List[Condition], steps: List[str]) -> SymptomResponse:
+    # fresh lists per response; the shared Condition objects are frozen
+    return SymptomResponse.model_construct(input=symptoms, probable_conditions=list(pcs), recommended_next_steps=list(steps), disclaimer=_DISCL)
+
+@lru_cache(maxsize=None)
+def _rule_condition(cond: str, score: float) -> Condition:
+    return Condition(condition=cond, rationale="Matched rule keywords.", confidence="medium" if score < 1.0 else "high", relative_score=score)
+
+_MOCK_CONDITIONS = [
+    {"condition": _UNCLEAR, "rationale": "Based on matching keywords.", "confidence": "low", "relative_score": 0.0}
+]
+_MOCK_STEPS = [
+    "Educational only. Monitor symptoms and consult a healthcare provider if worsening.",
+    "If severe or emergency signs: seek emergency care."
+]
+
+# The mock output is constant except for "input": serialize it once with a marker
+_MOCK_BYTES = orjson.dumps({
+    "input": "__S__",
+    "probable_conditions": _MOCK_CONDITIONS,
+    "recommended_next_steps": _MOCK_STEPS,
+    "disclaimer": "Educational use only. Not medical advice."
+})
+
 # Mock LLM: returns well-formed JSON string complying with SymptomResponse schema
 def mock_llm(symptoms: str) -> str:
-    out = {
-        "input": symptoms,
-        "probable_conditions": [
-            {"condition": "Unclear — further questions required", "rationale": "Based on matching keywords.", "confidence": "low", "relative_score": 0.0}
-        ],
-        "recommended_next_steps": [
-            "Educational only. Monitor symptoms and consult a healthcare provider if worsening.",
-            "If severe or emergency signs: seek emergency care."
-        ],
-        "disclaimer": "Educational use only. Not medical advice."
-    }
-    return json.dumps(out, ensure_ascii=False)
+    return _MOCK_BYTES.replace(b'"__S__"', orjson.dumps(symptoms), 1).decode()
 
 def _ensure_log_dir():
     d = os.path.dirname(RAW_LOG)
     if d and not os.path.exists(d):
         os.makedirs(d, exist_ok=True)
 
-def call_openai_llm(symptoms: str, timeout_secs: int = 15) -> str:
-    """
-    Returns raw string (LLM output) — either from OpenAI or the mock.
-    Always appends the raw output to RAW_LOG for debugging.
-    """
-    _ensure_log_dir()
-    # If OpenAI is not configured, use mock
-    if not USE_OPENAI or openai is None:
-        raw = mock_llm(symptoms)
-        try:
-            with open(RAW_LOG, "a", encoding="utf-8") as f:
-                f.write("----MOCK CALL----\n")
-                f.write(raw + "\n")
-        except Exception:
-            pass
-        return raw
+# Raw LLM output is queued by _raw_log and appended by one background thread
+# through a file handle opened once, in batches every RAW_LOG_FLUSH_SECS.
+RAW_LOG_FLUSH_SECS = 0.1
+_RAW_Q: "queue.SimpleQueue" = queue.SimpleQueue()
 
-    # Use OpenAI (handle exceptions)
-    if not LLM_RATE_LIMITER.allow():
-        raise RuntimeError("LLM rate limit exceeded")
+def _raw_log(tag: str, text: str):
+    _RAW_Q.put(f"----{tag}----\n{text}\n".encode("utf-8"))
+
+def _raw_log_writer():
+    try:
+        _ensure_log_dir()
+        f = open(RAW_LOG, "ab", buffering=1 << 16)
+    except Exception:
+        f = None
+    while True:
+        batch = [_RAW_Q.get()]
+        time.sleep(RAW_LOG_FLUSH_SECS)
+        while not _RAW_Q.empty():
+            batch.append(_RAW_Q.get_nowait())
+        lines = [b for b in batch if b is not None]
+        if f is not None and lines:
+            try:
+                f.write(b"".join(lines))
+                f.flush()
+            except Exception:
+                pass
+        if len(lines) != len(batch):  # None is the shutdown sentinel
+            if f is not None:
+                f.close()
+            return
+
+_RAW_THREAD = threading.Thread(target=_raw_log_writer, name="raw-llm-log-writer", daemon=True)
+_RAW_THREAD.start()
 
-    system_msg = "You are a conservative educational medical assistant. Output ONLY valid JSON with no extra text."
-    # PROMPT_TEMPLATE: use a literal with {symptoms} placeholder which we'll replace (not .format)
-    PROMPT_TEMPLATE = """
-You are a conservative educational medical assistant. IMPORTANT: Output ONLY valid JSON (no commentary, no code fences, no explanation). If you cannot produce valid JSON, output {"error":"cannot_respond"}.
+@atexit.register
+def _flush_raw_log():
+    _RAW_Q.put(None)
+    _RAW_THREAD.join(timeout=5)
+
+# Static instructions go in the system message, byte-identical on every call, so
+# the provider's prompt cache can reuse the prefix; only the symptoms vary.
+SYSTEM_PROMPT = """You are a conservative educational medical assistant. IMPORTANT: Output ONLY valid JSON (no commentary, no code fences, no explanation). If you cannot produce valid JSON, output {"error":"cannot_respond"}.
 
 Output must match this schema exactly:
 
@@ -99,42 +249,100 @@ Rules:
 - Provide 1-5 probable_conditions with short rationale (1-2 sentences) and confidence (low/medium/high).
 - If emergency signs exist (chest pain, severe breathlessness, severe bleeding, fainting) return a single high-confidence emergency condition and recommended_next_steps starting with "Seek emergency care immediately".
 - Do NOT include treatments, dosages, or prescriptions.
-Input symptoms: {symptoms}
 """
-    user_msg = PROMPT_TEMPLATE.replace("{symptoms}", symptoms)
+LLM_MAX_TOKENS = 400
+
+async def call_openai_llm(symptoms: str, timeout_secs: int = 15) -> str:
+    """
+    Returns raw string (LLM output) — either from OpenAI or the mock.
+    Appends the raw output to RAW_LOG for debugging (mock output only when DEBUG is set).
+    """
+    text, _ = await _call_llm(symptoms, timeout_secs)
+    return text
+
+async def _call_llm(symptoms: str, timeout_secs: int = 15) -> Tuple[str, bool]:
+    """
+    Like call_openai_llm, but also reports whether the text came from the live LLM
+    (False for the mock and for error fallbacks, which must not be cached).
+    """
+    # If OpenAI is not configured, use mock
+    if not USE_OPENAI or _OAI is None:
+        raw = mock_llm(symptoms)
+        if DEBUG:
+            _raw_log("MOCK CALL", raw)
+        return raw, False
+
+    # Use OpenAI (handle exceptions)
+    if not LLM_RATE_LIMITER.allow():
+        raise RuntimeError("LLM rate limit exceeded")
+
     try:
-        resp = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role":"system","content":system_msg},{"role":"user","content":user_msg}],
-            temperature=0.0,
-            max_tokens=700,
-            request_timeout=timeout_secs
+        resp = await asyncio.wait_for(
+            _OAI.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[{"role":"system","content":SYSTEM_PROMPT},{"role":"user","content":f"Input symptoms: {symptoms}"}],
+                temperature=0.0,
+                max_tokens=LLM_MAX_TOKENS,
+            ),
+            timeout_secs
         )
-        text = resp["choices"][0]["message"]["content"]
+        text = resp.choices[0].message.content
     except Exception as e:
         # on any error, fall back to mock and log the exception
-        try:
-            with open(RAW_LOG, "a", encoding="utf-8") as f:
-                f.write("----OPENAI_ERROR----\n")
-                f.write(str(e) + "\n")
-        except Exception:
-            pass
+        live = False
+        _raw_log("OPENAI_ERROR", str(e))
         text = mock_llm(symptoms)
-        try:
-            with open(RAW_LOG, "a", encoding="utf-8") as f:
-                f.write("----FALLBACK_MOCK_OUTPUT----\n")
-                f.write(text + "\n")
-        except Exception:
-            pass
+        _raw_log("FALLBACK_MOCK_OUTPUT", text)
     else:
+        live = True
         # log successful raw output
+        _raw_log("CALL", text)
+    return text, live
+
+_TRAIL = re.compile(r",\s*([}\]])")
+
+def _extract_json_block(raw: str):
+    # find largest {...} / [...] block in one pass: a stack of opener indices pops
+    # only on the matching closer (brackets inside string literals don't count), and
+    # every popped span is a balanced candidate. A stray unclosed opener just stays
+    # on the stack, so it can't swallow the real object after it.
+    stack = []
+    best = (-1, -1)
+    in_string = escaped = False
+    for i, c in enumerate(raw):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = bool(stack)
+        elif c == "{" or c == "[":
+            stack.append(i)
+        elif stack and (c == "}" or c == "]") and raw[stack[-1]] == ("{" if c == "}" else "["):
+            j = stack.pop()
+            if i - j > best[1] - best[0]:
+                best = (j, i)
+    if best[0] != -1:
+        return raw[best[0]:best[1]+1]
+    fi = raw.find("{"); la = raw.rfind("}")
+    if fi != -1 and la != -1 and la > fi:
+        return raw[fi:la+1]
+    return None
+
+def _try_load(s):
+    # Try several JSON fixes, only after the plain parse fails
+    try:
+        return orjson.loads(s)
+    except Exception:
+        s2 = _TRAIL.sub(r"\1", s)  # remove trailing commas
         try:
-            with open(RAW_LOG, "a", encoding="utf-8") as f:
-                f.write("----CALL----\n")
-                f.write(text + "\n")
+            return orjson.loads(s2)
         except Exception:
-            pass
-    return text
+            s3 = s2.replace("'", '"')
+            return orjson.loads(s3)
 
 def parse_and_validate_json(raw_text: str) -> SymptomResponse:
     """
@@ -144,43 +352,21 @@ def parse_and_validate_json(raw_text: str) -> SymptomResponse:
     raw = raw_text.strip()
     # strip triple-backtick fences if present
     if raw.startswith("```") and raw.endswith("```"):
-        raw = "\n".join([l for l in raw.splitlines() if not l.strip().startswith("```")]).strip()
-
-    # find largest {...} block
-    candidates = []
-    for start_ch, end_ch in [("{","}"), ("[","]")]:
-        for m in re.finditer(re.escape(start_ch), raw):
-            si = m.start()
-            depth = 0
-            for j in range(si, len(raw)):
-                if raw[j] == start_ch:
-                    depth += 1
-                elif raw[j] == end_ch:
-                    depth -= 1
-                    if depth == 0:
-                        candidates.append(raw[si:j+1])
-                        break
-    candidate = max(candidates, key=len) if candidates else None
-    if candidate is None:
-        fi = raw.find("{"); la = raw.rfind("}")
-        if fi != -1 and la != -1 and la > fi:
-            candidate = raw[fi:la+1]
-    if candidate is None:
-        raise ValueError("Could not locate JSON in LLM output")
-
-    # Try several JSON fixes
-    def try_load(s):
+        raw = raw[raw.find("\n")+1:raw.rfind("```")].strip()
+
+    # fast path: output is already a well-formed JSON object
+    parsed = None
+    if raw.startswith("{"):
         try:
-            return json.loads(s)
+            parsed = orjson.loads(raw)
         except Exception:
-            s2 = re.sub(r",\s*([}\]])", r"\1", s)  # remove trailing commas
-            try:
-                return json.loads(s2)
-            except Exception:
-                s3 = s2.replace("'", '"')
-                return json.loads(s3)
+            parsed = None
 
-    parsed = try_load(candidate)
+    if not isinstance(parsed, dict):
+        candidate = _extract_json_block(raw)
+        if candidate is None:
+            raise ValueError("Could not locate JSON in LLM output")
+        parsed = _try_load(candidate)
 
     # rescue missing relative_score
     pcs = parsed.get("probable_conditions", [])
@@ -203,14 +389,21 @@ def parse_and_validate_json(raw_text: str) -> SymptomResponse:
         parsed["notes"] = (parsed.get("notes","") + " parsed_and_rescued_relative_score").strip()
 
     # Validate with Pydantic
-    resp = SymptomResponse(**parsed)
+    resp = SymptomResponse.model_validate(parsed)
     return resp
 
 def _init_db():
-    # idempotent create
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
+    # idempotent create; runs once at import and returns the long-lived connection
+    d = os.path.dirname(DB_PATH)
+    if d and not os.path.exists(d):
+        os.makedirs(d, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("""
     CREATE TABLE IF NOT EXISTS queries (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         symptom_hash TEXT,
@@ -222,77 +415,150 @@ def _init_db():
     );
     """)
     conn.commit()
-    conn.close()
-
-def log_query(symptom_text: str, engine: str, top_condition: str, top_score: float, notes: str = ""):
-    _init_db()
-    h = hashlib.sha256(symptom_text.strip().lower().encode("utf-8")).hexdigest()
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("INSERT INTO queries (symptom_hash, timestamp_utc, engine, top_condition, top_score, notes) VALUES (?, datetime('now'), ?, ?, ?, ?)",
-                (h, engine, top_condition, float(top_score), notes))
-    conn.commit()
-    conn.close()
+    return conn
 
-def get_safely_inferred(symptoms: str, allow_llm: bool = True, fuzzy_label_choices: List[str] = None) -> SymptomResponse:
+# History rows are queued by log_query and written by a single background thread,
+# up to LOG_BATCH_SIZE rows (or LOG_BATCH_SECS of rows) per transaction.
+LOG_BATCH_SIZE = 64
+LOG_BATCH_SECS = 0.05
+_INSERT_SQL = "INSERT INTO queries (symptom_hash, timestamp_utc, engine, top_condition, top_score, notes) VALUES (?, datetime('now'), ?, ?, ?, ?)"
+_DB = _init_db()
+_LOG_Q: "queue.Queue" = queue.Queue()
+
+def _log_writer():
+    while True:
+        batch = [_LOG_Q.get()]
+        deadline = time.monotonic() + LOG_BATCH_SECS
+        while len(batch) < LOG_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_LOG_Q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        rows = [r for r in batch if r is not None]
+        if rows:
+            try:
+                _DB.executemany(_INSERT_SQL, rows)
+                _DB.commit()
+            except Exception:
+                # keep the writer alive, but leave a trace of the lost rows
+                logger.exception("Dropped %d history rows: write to %s failed", len(rows), DB_PATH)
+        if len(rows) != len(batch):  # None is the shutdown sentinel
+            return
+
+_LOG_THREAD = threading.Thread(target=_log_writer, name="history-db-writer", daemon=True)
+_LOG_THREAD.start()
+
+@atexit.register
+def _flush_log():
+    _LOG_Q.put(None)
+    _LOG_THREAD.join(timeout=5)
+
+def _log_row(h: str, engine: str, top_condition: str, top_score: float, notes: str = ""):
+    _LOG_Q.put_nowait((h, engine, top_condition, float(top_score), notes))
+
+def log_query(symptom_text, engine: str, top_condition: str, top_score: float, notes: str = ""):
+    """Queue an anonymized history row; never blocks on disk.
+    symptom_text may be the raw string or the already-normalized UTF-8 bytes."""
+    if isinstance(symptom_text, str):
+        symptom_text = symptom_text.strip().lower().encode("utf-8")
+    _log_row(_symptom_hash(symptom_text), engine, top_condition, top_score, notes)
+
+def _dispatch(symptoms: str, key: str):
     """
-    Primary orchestration:
-    - emergency short-circuit
-    - rule-based inference
-    - if none/confident, return
-    - else fallback to LLM (if allowed)
+    Local fast path: emergency short-circuit, then rule-based inference.
+    Returns None when neither applies and the caller should consult the LLM.
     """
-    # Emergency keywords (simple)
-    s = symptoms.lower()
-    emergencies = ["chest pain", "severe chest pain", "difficulty breathing", "shortness of breath", "unconscious", "severe bleeding", "fainting"]
-    for e in emergencies:
-        if e in s:
-            # return emergency response
-            out = {
-                "input": symptoms,
-                "probable_conditions": [{"condition":"Possible emergency — seek immediate care","rationale":"Emergency keyword matched.","confidence":"high","relative_score":1.0}],
-                "recommended_next_steps":["Seek emergency care immediately."],
-                "disclaimer":"Educational only. Not medical advice."
-            }
-            log_query(symptoms, "emergency", out["probable_conditions"][0]["condition"], 1.0, "emergency_short_circuit")
-            return SymptomResponse(**out)
+    # Normalize once; one keyword pass yields both emergency and rule hits
+    norm = normalize_text(symptoms)
+    rule_mask, emergency_hits = scan_keywords(norm)
+
+    # Emergency keywords (see rule_based_v2.EMERGENCIES)
+    if emergency_hits:
+        # return emergency response
+        _log_row(key, "emergency", _EMERGENCY_PC[0].condition, 1.0, "emergency_short_circuit")
+        return _static_response(symptoms, _EMERGENCY_PC, _EMERGENCY_STEPS)
 
     # Rule-based
-    rules = infer_conditions(symptoms)  # list of (cond, score)
+    rules = rule_conditions(rule_mask)  # list of (cond, score)
     if rules and rules[0][1] > 0.0:
-        pcs = [{"condition":cond, "rationale":"Matched rule keywords.","confidence":"medium" if score<1.0 else "high", "relative_score":score} for cond,score in rules]
-        out = {"input": symptoms, "probable_conditions": pcs, "recommended_next_steps":["Educational only. Consider seeing a clinician for evaluation."], "disclaimer":"Educational only. Not medical advice."}
+        pcs = [_rule_condition(cond, score) for cond, score in rules]
         # log top rule
-        log_query(symptoms, "rule_based", pcs[0]["condition"], pcs[0]["relative_score"], "rule_based_match")
-        return SymptomResponse(**out)
+        _log_row(key, "rule_based", pcs[0].condition, pcs[0].relative_score, "rule_based_match")
+        return _static_response(symptoms, pcs, _CLINICIAN_STEPS)
+
+    return None
+
+async def get_safely_inferred_async(symptoms: str, allow_llm: bool = True, fuzzy_label_choices: List[str] = None) -> SymptomResponse:
+    """
+    Primary orchestration (awaitable):
+    - emergency short-circuit
+    - rule-based inference
+    - if none/confident, return
+    - else exact/semantic cache hit, then fallback to LLM (if allowed)
+    Cached LLM answers never take precedence over the emergency/rule path.
+    """
+    key = _symptom_hash(symptoms.strip().lower().encode("utf-8"))
+    resp = _dispatch(symptoms, key)
+    if resp is not None:
+        return resp
+
+    cached = _exact_get(key)
+    if cached is not None:
+        top = cached.probable_conditions[0]
+        _log_row(key, "cache", top.condition, top.relative_score or 0.0, "exact_cache_hit")
+        return cached.model_copy(update={"input": symptoms}, deep=True)
 
     # Fallback to LLM if allowed
     if allow_llm:
-        raw = call_openai_llm(symptoms)
+        vec = await asyncio.to_thread(_embed, symptoms)
+        cached = _semantic_get(vec)
+        if cached is not None:
+            top = cached.probable_conditions[0]
+            _log_row(key, "cache", top.condition, top.relative_score or 0.0, "semantic_cache_hit")
+            return cached.model_copy(update={"input": symptoms}, deep=True)
+
+        raw, live = await _call_llm(symptoms)
         try:
             validated = parse_and_validate_json(raw)
             # log success
             top = validated.probable_conditions[0]
-            log_query(symptoms, "llm", top.condition, getattr(top, "relative_score", 0.0), getattr(validated, "notes", ""))
+            _log_row(key, "llm", top.condition, top.relative_score or 0.0, getattr(validated, "notes", ""))
+            if live:
+                # cache only once the whole success path has run, as a private
+                # copy so the caller can't mutate the cached entry
+                _cache_put(key, vec, validated.model_copy(deep=True))
             return validated
         except Exception as e:
             # log parse error and fallback response
             notes = f"llm_parse_error:{str(e)}"
-            log_query(symptoms, "fallback", "Unclear — further questions required", 0.0, notes)
-            fallback = {
-                "input": symptoms,
-                "probable_conditions": [{"condition":"Unclear — further questions required","rationale":"Fallback due to LLM parse/validation error.","confidence":"low","relative_score":0.0}],
-                "recommended_next_steps":["Educational only. Consider seeing a clinician for evaluation."],
-                "disclaimer":"Educational only. Not medical advice."
-            }
-            return SymptomResponse(**fallback)
+            _log_row(key, "fallback", _UNCLEAR, 0.0, notes)
+            return _static_response(symptoms, _PARSE_ERROR_PC, _CLINICIAN_STEPS)
     else:
         # LLM not allowed: safe fallback
-        log_query(symptoms, "no_llm", "Unclear — further questions required", 0.0, "llm_disabled")
-        fallback = {
-            "input": symptoms,
-            "probable_conditions": [{"condition":"Unclear — further questions required","rationale":"LLM disabled or no rules matched.","confidence":"low","relative_score":0.0}],
-            "recommended_next_steps":["Educational only. Consider seeing a clinician for evaluation."],
-            "disclaimer":"Educational only. Not medical advice."
-        }
-        return SymptomResponse(**fallback)
+        _log_row(key, "no_llm", _UNCLEAR, 0.0, "llm_disabled")
+        return _static_response(symptoms, _NO_LLM_PC, _CLINICIAN_STEPS)
+
+_SYNC_LOOP = None
+_SYNC_LOCK = threading.Lock()
+
+def _sync_loop():
+    # One event loop on a background thread, shared by all blocking callers. It works
+    # even when the caller already runs a loop (Jupyter/Colab), and keeps the pooled
+    # OpenAI client's connections bound to a single live loop.
+    global _SYNC_LOOP
+    with _SYNC_LOCK:
+        if _SYNC_LOOP is None:
+            _SYNC_LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_SYNC_LOOP.run_forever, name="sync-inference-loop", daemon=True).start()
+    return _SYNC_LOOP
+
+def get_safely_inferred(symptoms: str, allow_llm: bool = True, fuzzy_label_choices: List[str] = None) -> SymptomResponse:
+    """
+    Blocking entry point for scripts/notebooks; the API awaits get_safely_inferred_async.
+    Safe to call from inside a running event loop: the work runs on _sync_loop().
+    """
+    coro = get_safely_inferred_async(symptoms, allow_llm, fuzzy_label_choices)
+    return asyncio.run_coroutine_threadsafe(coro, _sync_loop()).result()
@@ -1,14 +1,20 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Annotated, List, Optional
 
 class Condition(BaseModel):
-    condition: str
+    # immutable: prebuilt/cached instances are shared across responses
+    model_config = ConfigDict(frozen=True)
+
+    condition: Annotated[str, Field(min_length=1)]
     rationale: str
     confidence: str
     relative_score: Optional[float] = 0.0
 
 class SymptomResponse(BaseModel):
     input: str
-    probable_conditions: List[Condition]
+    probable_conditions: Annotated[List[Condition], Field(min_length=1)]
     recommended_next_steps: List[str]
     disclaimer: str
+
+class SymptomIn(BaseModel):
+    symptoms: str
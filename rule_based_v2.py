@@ -1,5 +1,11 @@
 import re
 
+# Optional single-pass keyword matcher (pip install pyahocorasick)
+try:
+    import ahocorasick
+except Exception:
+    ahocorasick = None
+
 SYNONYMS = {
     "throwing up": "vomiting",
     "throw up": "vomiting",
@@ -23,18 +29,90 @@ RULES = {
     "fatigue": ["anemia", "stress", "sleep deprivation"]
 }
 
+EMERGENCIES = ["chest pain", "severe chest pain", "difficulty breathing", "shortness of breath", "unconscious", "severe bleeding", "fainting"]
+
+# one alternation for all synonyms; longest first so "soar throat" wins over "soar"
+_SYN_RE = re.compile(r"\b(" + "|".join(sorted(map(re.escape, SYNONYMS), key=len, reverse=True)) + r")\b")
+_NONALPHA = re.compile(r"[^a-z\s]")
+
 def normalize_text(text):
-    text = text.lower()
-    for k, v in SYNONYMS.items():
-        text = text.replace(k, v)
-    text = re.sub(r"[^a-z\s]", " ", text)
-    return text.strip()
+    text = _SYN_RE.sub(lambda m: SYNONYMS[m.group(0)], text.lower())
+    return _NONALPHA.sub(" ", text).strip()
 
-def infer_conditions(symptom_text):
-    text = normalize_text(symptom_text)
+# Bitset tables: rule keyword i is bit i of a keyword mask; each condition gets a
+# bit too, and _RULE_CONDS[i] holds keyword i's (bit, condition) pairs in RULES order.
+# All matcher state is derived from RULES/EMERGENCIES by rebuild_matchers().
+_KEY_IDX = {}
+_RULE_CONDS = []
+_AC = None
+_scan = None
+
+def _build_automaton():
+    # one automaton over rule + emergency keywords; values carry the keyword bit
+    # (0 marks an emergency keyword)
+    if ahocorasick is None:
+        return None
+    A = ahocorasick.Automaton()
+    for key, i in _KEY_IDX.items():
+        A.add_word(key, (key, 1 << i))
+    for key in EMERGENCIES:
+        A.add_word(key, (key, 0))
+    A.make_automaton()
+    return A
+
+def _ac_scan(text):
+    mask, emergency_hits = 0, set()
+    for _, (key, bit) in _AC.iter(text):
+        if bit:
+            mask |= bit
+        else:
+            emergency_hits.add(key)
+    return mask, emergency_hits
+
+def _codegen_scan():
+    # without pyahocorasick, generate a scanner specialized to the current tables:
+    # every keyword and bit becomes a literal, so no loops or table lookups remain
+    lines = ["def _scan(text):", "    mask = 0", "    emergency_hits = set()"]
+    for key, i in _KEY_IDX.items():
+        lines.append(f"    if {key!r} in text: mask |= {1 << i}")
+    for key in EMERGENCIES:
+        lines.append(f"    if {key!r} in text: emergency_hits.add({key!r})")
+    lines.append("    return mask, emergency_hits")
+    ns = {}
+    exec(compile("\n".join(lines), "<rule_based_v2 scanner>", "exec"), ns)
+    return ns["_scan"]
+
+def rebuild_matchers():
+    """Recompute bitset tables and the keyword scanner; call after editing RULES or EMERGENCIES."""
+    global _KEY_IDX, _RULE_CONDS, _AC, _scan
+    _KEY_IDX = {key: i for i, key in enumerate(RULES)}
+    cond_idx = {cond: i for i, cond in enumerate(dict.fromkeys(c for conds in RULES.values() for c in conds))}
+    _RULE_CONDS = [[(1 << cond_idx[cond], cond) for cond in RULES[key]] for key in RULES]
+    _AC = _build_automaton()
+    _scan = _ac_scan if _AC is not None else _codegen_scan()
+
+rebuild_matchers()
+
+def scan_keywords(text):
+    """Return (rule keyword bitmask, emergency keywords) found in text, in a single pass."""
+    return _scan(text)
+
+def rule_conditions(mask):
+    """Map a rule keyword bitmask to (condition, score) pairs in RULES order, each condition once."""
+    seen = 0
     results = []
-    for key, conditions in RULES.items():
-        if key in text:
-            for cond in conditions:
+    while mask:
+        low = mask & -mask
+        for bit, cond in _RULE_CONDS[low.bit_length() - 1]:
+            if not seen & bit:
+                seen |= bit
                 results.append((cond, 1.0))
-    return results or []
+        mask ^= low
+    return results
+
+def infer_conditions_norm(normalized):
+    mask, _ = scan_keywords(normalized)
+    return rule_conditions(mask)
+
+def infer_conditions(symptom_text):
+    return infer_conditions_norm(normalize_text(symptom_text))
@@ -0,0 +1,28 @@
+import time
+
+import orjson
+
+from llm_wrapper import _extract_json_block, mock_llm, parse_and_validate_json
+
+
+def test_recovers_object_after_stray_opener():
+    good = mock_llm("a")
+    assert _extract_json_block("{ broken " + good) == good
+    assert _extract_json_block("[x, " + good) == good
+    assert parse_and_validate_json("{ broken " + good).input == "a"
+
+
+def test_ignores_brackets_inside_strings():
+    raw = 'Sure: {"input": "a {b", "x": "c\\" ]}"} thanks'
+    assert orjson.loads(_extract_json_block(raw)) == {"input": "a {b", "x": 'c" ]}'}
+
+
+def test_mismatched_closer_does_not_balance():
+    assert _extract_json_block('{"a": [1, 2}') == '{"a": [1, 2}'
+    assert _extract_json_block('{"a": [1, 2]}') == '{"a": [1, 2]}'
+
+
+def test_scan_is_linear_on_unclosed_openers():
+    t = time.perf_counter()
+    assert _extract_json_block("{" * 200000) is None
+    assert time.perf_counter() - t < 1.0